@@ -1,53 +1,169 @@
+import asyncio
 import logging
 from langchain.schema.runnable.config import RunnableConfig
 import chainlit as cl
 from langsmith import traceable
-from src.runner import clarify_query_topics, get_companies_from_query, download_data, default_chat_chain, \
-    synthesise_query_result_chain
+from src import RESPONSE_TIMEOUT, SYNTHESIS_TIMEOUT
+from src.context import ConversationContext
+from src.quotes import QuoteHub
+from src.runner import clarify_query_topics, get_companies_from_query, download_pairs, default_chat_chain, \
+    synthesise_query_result_chain, get_screen_from_query, Deadline, UNIVERSE_TOPICS, QUESTION_TOPICS
+
+# One poller per symbol for the whole process, shared by every session watching it
+quote_hub = QuoteHub()
+LIVE_QUOTE_TOPICS = {"trading_information"}
+
+
+async def _within(deadline, func, *args, default=None):
+    try:
+        return await asyncio.wait_for(cl.make_async(func)(*args), timeout=deadline.remaining())
+    except asyncio.TimeoutError:
+        logging.warning(f"{func.__name__} missed the deadline")
+        return default
+
+
+async def _stream_within(deadline, stream):
+    iterator = stream.__aiter__()
+    while True:
+        try:
+            yield await asyncio.wait_for(iterator.__anext__(), timeout=deadline.remaining())
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            logging.warning("Synthesis missed the deadline")
+            yield "\n\n_(answer truncated: time limit reached)_"
+            return
 
 
 @cl.step
-async def _clarify_query_topics(question):
-    topics = clarify_query_topics(question)
+async def _clarify_query_topics(question, deadline):
+    topics = await _within(deadline, clarify_query_topics, question, default=[])
     return list(topics)
 
 
-@cl.step
-async def _get_companies_from_query(question):
+def _list_companies_from_query(question):
+    # names whose ticker lookup failed stay as None so they are not mistaken for "no company named"
     return list(get_companies_from_query(question))
 
 
 @cl.step
-async def _download_data(topics, companies) -> list:
-    return list(download_data(topics, companies))
+async def _get_companies_from_query(question, deadline):
+    return await _within(deadline, _list_companies_from_query, question, default=None)
+
+
+@cl.step
+async def _get_screen_from_query(question, deadline):
+    return await _within(deadline, get_screen_from_query, question, default={})
+
+
+async def _plan_downloads(topics, companies, question, context, deadline):
+    reused, pending = context.plan([topic for topic in topics if topic not in QUESTION_TOPICS], companies)
+    # answers of these topics depend on the question itself, they are never reused
+    pending += [
+        (topic, {**company, "question": question})
+        for topic in topics if topic in QUESTION_TOPICS - UNIVERSE_TOPICS
+        for company in companies
+    ]
+    universe_topics = [topic for topic in topics if topic in UNIVERSE_TOPICS]
+    if universe_topics:
+        screen = await _get_screen_from_query(question, deadline)
+        pending += [(topic, {"symbol": None, "screen": screen}) for topic in universe_topics]
+    return reused, pending
+
+
+@cl.step
+async def _download_data(pending, deadline) -> tuple:
+    # download_pairs enforces the deadline itself and returns whatever arrived in time
+    return await cl.make_async(download_pairs)(pending, deadline.remaining())
+
+
+def _conversation_context():
+    context = cl.user_session.get("context")
+    if context is None:
+        context = ConversationContext()
+        cl.user_session.set("context", context)
+    return context
+
+
+async def _stream_quotes(symbol, queue):
+    quote = {}
+    msg = cl.Message(content=f"**{symbol}** live quote: waiting for data")
+    await msg.send()
+    while True:
+        quote.update(await queue.get())
+        msg.content = f"**{symbol}** live quote: price {quote.get('price')}, volume {quote.get('volume')}"
+        await msg.update()
+
+
+def _watch_quotes(companies):
+    streams = cl.user_session.get("quote_streams") or {}
+    for company in companies:
+        symbol = company.get("symbol") if company else None
+        if symbol is None or symbol in streams:
+            continue
+        queue = quote_hub.subscribe(symbol)
+        streams[symbol] = (queue, asyncio.create_task(_stream_quotes(symbol, queue)))
+    cl.user_session.set("quote_streams", streams)
+
+
+@cl.on_chat_end
+async def stop_quotes():
+    for symbol, (queue, task) in (cl.user_session.get("quote_streams") or {}).items():
+        task.cancel()
+        quote_hub.unsubscribe(symbol, queue)
 
 
 @cl.on_message
 @traceable
 async def market_chat(message: cl.Message):
+    # Every stage shares one budget, synthesis keeps its own share at the end
+    deadline = Deadline(RESPONSE_TIMEOUT)
+    fetch_deadline = Deadline(max(0.0, RESPONSE_TIMEOUT - SYNTHESIS_TIMEOUT))
+
     # Step 1: User Asks a Question
     question = message.content
+    context = _conversation_context()
 
     # Step 2: Generate SQL Query
-    topics = await _clarify_query_topics(question)
+    # "none_of_above" marks an off-topic question, it has no data and must not pull in earlier companies
+    topics = [topic for topic in await _clarify_query_topics(question, fetch_deadline) if topic != "none_of_above"]
     data = list()
+    companies = list()
     if len(topics) == 0:
         chain = default_chat_chain()
     else:
-        companies = await _get_companies_from_query(question)
-        if len(companies) == 0:
+        if UNIVERSE_TOPICS.issuperset(topics):
+            # universe-wide screens need no company
+            companies = []
+        else:
+            named = await _get_companies_from_query(question, fetch_deadline)
+            if named is None:
+                # extraction missed the deadline, do not guess the company from the conversation
+                companies = []
+            elif len(named) == 0:
+                # Follow-ups such as "and its dividends?" name no company, keep discussing the previous ones
+                companies = context.companies
+            else:
+                companies = [company for company in named if company is not None]
+        if len(companies) == 0 and not UNIVERSE_TOPICS.intersection(topics):
             chain = default_chat_chain()
         else:
-            data = await _download_data(topics, companies)
-            chain = synthesise_query_result_chain(companies, [d[0] for d in data])
+            if companies:
+                context.remember_companies(companies)
+            # the session context stays out of the step, steps record their arguments as input
+            reused, pending = await _plan_downloads(topics, companies, question, context, fetch_deadline)
+            results, missing = await _download_data(pending, fetch_deadline)
+            context.remember({key: value for key, value in results.items() if key[0] not in QUESTION_TOPICS})
+            data = list({**reused, **results}.values())
+            chain = synthesise_query_result_chain(companies, [d[0] for d in data], missing)
 
     msg = cl.Message(content="")
     output_msg = ""
     # Stream the response to the user (Step 4)
-    async for chunk in chain.astream(
+    async for chunk in _stream_within(deadline, chain.astream(
         {"question": question},
         config=RunnableConfig(callbacks=[cl.LangchainCallbackHandler()]),
-    ):
+    )):
         await msg.stream_token(chunk)
         output_msg += chunk
 
@@ -57,4 +173,7 @@ async def market_chat(message: cl.Message):
             msg.elements.append(cl.Plotly(figure=fig, display="inline"))
 
     await msg.send()
+
+    if LIVE_QUOTE_TOPICS.intersection(topics):
+        _watch_quotes(companies)
     return output_msg
@@ -1,6 +1,36 @@
+import os
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'
 YAHOO_FIN_SEARCH_BASE = "https://query2.finance.yahoo.com/v1/finance/search"
+CACHE_DIR = os.environ.get("CACHE_DIR", ".cache")
+
+# Latency budget (seconds) for a whole chat message, and the share of it kept for synthesis
+RESPONSE_TIMEOUT = float(os.environ.get("RESPONSE_TIMEOUT", 30))
+SYNTHESIS_TIMEOUT = float(os.environ.get("SYNTHESIS_TIMEOUT", 10))
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", 8))
+
+# Budgets (bytes) for the per-process ticker cache, the shared returns/price store and rendered charts
+TICKER_CACHE_BYTES = int(os.environ.get("TICKER_CACHE_BYTES", 256 * 1024 * 1024))
+SHARED_STORE_BYTES = int(os.environ.get("SHARED_STORE_BYTES", 1024 * 1024 * 1024))
+FIGURE_CACHE_BYTES = int(os.environ.get("FIGURE_CACHE_BYTES", 512 * 1024 * 1024))
+
+# Seconds between upstream polls of each symbol watched by live quote sessions
+QUOTE_POLL_INTERVAL = float(os.environ.get("QUOTE_POLL_INTERVAL", 5))
+
+# Seconds a dataset fetched in a chat session is reused by follow-up questions
+SESSION_DATA_TTL = float(os.environ.get("SESSION_DATA_TTL", 300))
+
+# Universe of the stock screener, a comma separated list of symbols or the URL of a CSV with a Symbol column
+SCREENER_UNIVERSE = os.environ.get(
+    "SCREENER_UNIVERSE",
+    "https://raw.githubusercontent.com/datasets/s-and-p-500-companies/main/data/constituents.csv"
+)
+SCREENER_REFRESH_INTERVAL = float(os.environ.get("SCREENER_REFRESH_INTERVAL", 24 * 3600))
+
+# Statement periods and holder rows included in an answer unless the question names specific years
+STATEMENT_PERIODS = int(os.environ.get("STATEMENT_PERIODS", 4))
+HOLDER_ROWS = int(os.environ.get("HOLDER_ROWS", 10))
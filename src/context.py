@@ -0,0 +1,47 @@
+import time
+
+from src import SESSION_DATA_TTL
+
+
+class ConversationContext:
+    """
+    Companies and datasets resolved earlier in a chat session, reused by follow-up questions.
+
+    Datasets are keyed by (topic, symbol) with the time they were fetched, so a follow-up only
+    downloads the topics it has not seen within `ttl` seconds.
+    """
+
+    def __init__(self, ttl=SESSION_DATA_TTL):
+        self.ttl = ttl
+        self.companies = []
+        self.datasets = {}
+
+    def remember_companies(self, companies):
+        self.companies = list(companies)
+
+    def plan(self, topics, companies):
+        """
+        Splits the (topic, company) pairs of a question into datasets that can be reused and
+        pairs that still have to be downloaded.
+
+        Returns:
+            tuple: (reused, pending) where reused maps (topic, symbol) to (data, fig) and pending
+                lists the (topic, company) pairs to download.
+        """
+        now = time.time()
+        reused, pending = {}, []
+        for topic in topics:
+            for company in companies:
+                key = (topic, company.get("symbol"))
+                entry = self.datasets.get(key)
+                if entry is not None and now - entry[0] <= self.ttl:
+                    reused[key] = entry[1:]
+                else:
+                    pending.append((topic, company))
+        return reused, pending
+
+    def remember(self, results):
+        now = time.time()
+        self.datasets = {key: entry for key, entry in self.datasets.items() if now - entry[0] <= self.ttl}
+        for key, (data, fig) in results.items():
+            self.datasets[key] = (now, data, fig)
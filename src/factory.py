@@ -7,7 +7,8 @@ from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_groq import ChatGroq
 
-from src.prompt import EXTRACT_COMPANY_NAME_PROMPT, ACTION_ROUTE_PROMPT, SYNTHETIC_PROMPT, DEFAULT_PROMPT
+from src.prompt import EXTRACT_COMPANY_NAME_PROMPT, ACTION_ROUTE_PROMPT, SYNTHETIC_PROMPT, DEFAULT_PROMPT, \
+    SCREENER_PROMPT
 from src.services import list_all_topics
 
 
@@ -52,7 +53,20 @@ class ChainFactory:
         )
 
     @staticmethod
-    def create_synthetic_chain(companies, data):
+    def create_screener_chain(fields, sectors):
+        return (
+            {"question": RunnablePassthrough()}
+            | PromptTemplate(
+                template=SCREENER_PROMPT,
+                input_variables=["question"],
+                partial_variables={"fields": fields, "sectors": sectors or "any sector name or null"}
+            )
+            | Model.DEFAULT_LLM
+            | StrOutputParser()
+        )
+
+    @staticmethod
+    def create_synthetic_chain(companies, data, missing):
         return (
             {"question": RunnablePassthrough()}
             | PromptTemplate(
@@ -61,6 +75,7 @@ class ChainFactory:
                 partial_variables={
                     "companies": companies,
                     "data": data,
+                    "missing": missing,
                     "today": datetime.datetime.now()
                 }
             )
@@ -24,6 +24,27 @@ ACTION_ROUTE_PROMPT = """The given question could be related to finance topic or
 - Question: {question}
 - Topic:"""
 
+SCREENER_PROMPT = """**Task**: Convert the given Details question into a stock screen. Adhere to the specific Rules and Example Response:
+**Rules**:
+- Respond with a single JSON object without any pre-amble
+- Keys: "sector", "industry", "min_market_cap", "max_market_cap", "sort_by", "ascending", "limit", "group_by"
+- "sort_by" must be one of: {fields}
+- "sector" must be one of: {sectors}
+- "group_by" must be "sector", "industry" or null
+- Large-cap means a market cap above 10000000000, mid-cap between 2000000000 and 10000000000, small-cap below 2000000000
+- Cheapest means ascending, highest or best means descending unless the metric is a valuation ratio
+- Use null for keys the question does not mention
+
+**Example Response**:
+- {{"sector": "Technology", "industry": null, "min_market_cap": 10000000000, "max_market_cap": null, "sort_by": "forwardPE", "ascending": true, "limit": 10, "group_by": null}}
+- {{"sector": null, "industry": null, "min_market_cap": null, "max_market_cap": null, "sort_by": "dividendYield", "ascending": false, "limit": 10, "group_by": "sector"}}
+
+**Details**:
+- Question: {question}
+
+**Response**:"""
+
+
 SYNTHETIC_PROMPT = """You are a helpful assistant who answers questions based on the information provided.
 
 **Task**: Create a response using the available Details while adhering to the following Rules:
@@ -31,11 +52,13 @@ SYNTHETIC_PROMPT = """You are a helpful assistant who answers questions based on
 **Rules**:
 - Always ensure a response to the input question. If the query results lack relevant information, reply with summarize of companies instead.
 - Avoid prefaces such as "based on information", "according to the provided data", etc.
+- If Missing lists any topics, briefly mention that this data could not be retrieved in time.
 
 **Details**:
 - Question: {question}
 - Companies: {companies}
 - Data: {data}
+- Missing: {missing}
 - Today: {today}
 """
 
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import random
+
+import yfinance as yf
+
+from src import QUOTE_POLL_INTERVAL
+
+
+def yahoo_quote(symbol):
+    """Latest price and volume from Yahoo Finance, using fast_info rather than a full info fetch."""
+    fast_info = yf.Ticker(symbol).fast_info
+    return {
+        "price": fast_info["lastPrice"],
+        "volume": fast_info["lastVolume"],
+    }
+
+
+class RandomWalkQuoteSource:
+    """Local stand-in for yahoo_quote, e.g. for trying the hub without network access."""
+
+    def __init__(self, price=100.0, seed=None):
+        self._random = random.Random(seed)
+        self._quotes = {}
+        self.price = price
+        self.calls = 0
+
+    def __call__(self, symbol):
+        self.calls += 1
+        quote = self._quotes.setdefault(symbol, {"price": self.price, "volume": 0})
+        if self._random.random() < 0.5:
+            quote["price"] = round(quote["price"] * (1 + self._random.gauss(0, 0.001)), 2)
+        quote["volume"] += self._random.randint(0, 1000)
+        return dict(quote)
+
+
+class QuoteHub:
+    """
+    Live quotes with a single upstream poller per watched symbol, fanned out to every subscriber.
+
+    Subscribers get a queue holding at most one pending update: the full quote when they join,
+    then only the fields that changed. A slow subscriber has its pending deltas merged instead of
+    queued, so upstream load depends on the number of symbols and never on the number of sessions.
+    """
+
+    def __init__(self, source=yahoo_quote, interval=QUOTE_POLL_INTERVAL):
+        self.source = source
+        self.interval = interval
+        self._subscribers = {}
+        self._pollers = {}
+        self._latest = {}
+
+    def subscribe(self, symbol):
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(symbol, set()).add(queue)
+        if symbol in self._latest:
+            queue.put_nowait(dict(self._latest[symbol]))
+        if symbol not in self._pollers:
+            logging.info(f"Start polling quotes for {symbol}")
+            self._pollers[symbol] = asyncio.create_task(self._poll(symbol))
+        return queue
+
+    def unsubscribe(self, symbol, queue):
+        subscribers = self._subscribers.get(symbol, set())
+        subscribers.discard(queue)
+        if not subscribers:
+            logging.info(f"Stop polling quotes for {symbol}")
+            self._subscribers.pop(symbol, None)
+            self._latest.pop(symbol, None)
+            poller = self._pollers.pop(symbol, None)
+            if poller is not None:
+                poller.cancel()
+
+    def watched(self):
+        return list(self._pollers)
+
+    async def _poll(self, symbol):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                quote = await loop.run_in_executor(None, self.source, symbol)
+            except Exception as ex:
+                logging.error(f"Failed to poll quote for {symbol}: {ex}")
+            else:
+                latest = self._latest.setdefault(symbol, {})
+                delta = {key: value for key, value in quote.items() if latest.get(key) != value}
+                if delta:
+                    latest.update(delta)
+                    self._publish(symbol, delta)
+            await asyncio.sleep(self.interval)
+
+    def _publish(self, symbol, delta):
+        for queue in self._subscribers.get(symbol, ()):
+            pending = queue.get_nowait() if queue.full() else {}
+            queue.put_nowait({**pending, **delta})
+
+
+if __name__ == "__main__":
+    # Example usage: three sessions watching two symbols share two upstream pollers
+    async def _demo():
+        source = RandomWalkQuoteSource(seed=0)
+        hub = QuoteHub(source, interval=0.1)
+        queues = [(symbol, hub.subscribe(symbol)) for symbol in ("MSFT", "MSFT", "AAPL")]
+        for _ in range(3):
+            for symbol, queue in queues:
+                print(symbol, await queue.get())
+        for symbol, queue in queues:
+            hub.unsubscribe(symbol, queue)
+        print("Upstream calls:", source.calls, "watched:", hub.watched())
+
+    asyncio.run(_demo())
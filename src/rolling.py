@@ -0,0 +1,223 @@
+import collections
+import copy
+import math
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from diskcache import Cache, Lock
+
+PERIODS_PER_YEAR = 252
+
+
+class RollingWindow:
+    """Running sums over the last `size` returns and benchmark returns, updated in O(1) per bar."""
+    METRICS = ("sharpe", "sortino", "volatility", "beta")
+
+    def __init__(self, size):
+        self.size = size
+        self.values = collections.deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.downside_sq = 0.0
+        self.bench_total = 0.0
+        self.bench_sq = 0.0
+        self.cross = 0.0
+
+    def append(self, value, bench):
+        self._add(value, bench, 1)
+        self.values.append((value, bench))
+        if len(self.values) > self.size:
+            self._add(*self.values.popleft(), -1)
+
+    def _add(self, value, bench, sign):
+        self.total += sign * value
+        self.total_sq += sign * value * value
+        self.downside_sq += sign * value * value if value < 0 else 0.0
+        self.bench_total += sign * bench
+        self.bench_sq += sign * bench * bench
+        self.cross += sign * value * bench
+
+    @property
+    def full(self):
+        return len(self.values) == self.size
+
+    def _variance(self, total, total_sq):
+        n = self.size
+        return max(0.0, (total_sq - total * total / n) / (n - 1))
+
+    def metrics(self):
+        """Annualised Sharpe, Sortino and volatility plus beta, in METRICS order, as quantstats computes them."""
+        if not self.full:
+            return (math.nan,) * len(self.METRICS)
+
+        n = self.size
+        mean = self.total / n
+        std = math.sqrt(self._variance(self.total, self.total_sq))
+        downside = math.sqrt(self.downside_sq / n)
+        bench_var = self._variance(self.bench_total, self.bench_sq)
+        covariance = (self.cross - self.total * self.bench_total / n) / (n - 1)
+        annual = math.sqrt(PERIODS_PER_YEAR)
+        return (
+            mean / std * annual if std else math.nan,
+            mean / downside * annual if downside else math.nan,
+            std * annual,
+            covariance / bench_var if bench_var else math.nan,
+        )
+
+
+def _as_ns(index):
+    """Timestamps of a DatetimeIndex as int64 nanoseconds, in UTC for tz-aware indexes."""
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    return index.to_numpy(dtype="datetime64[ns]").view("int64")
+
+
+def _clean(values):
+    return np.nan_to_num(np.asarray(values, dtype="float64"), nan=0.0, posinf=0.0, neginf=0.0)
+
+
+class RollingState:
+    """
+    Window accumulators of one symbol against a benchmark, extended bar by bar.
+
+    Only completed bars are committed to the windows. The latest bar may still be revised during
+    the session, so it is evaluated on a copy of the windows and never stored. If the last committed
+    bar changes upstream, the state is rebuilt from scratch. The state holds no metric history, so
+    it stays O(window) however long the symbol has been tracked.
+    """
+
+    def __init__(self, windows):
+        self.sizes = tuple(windows)
+        self.columns = [f"{name}_{size}" for size in self.sizes for name in RollingWindow.METRICS]
+        self.reset()
+
+    def reset(self):
+        self.windows = {size: RollingWindow(size) for size in self.sizes}
+        self.last = None
+        self.last_values = None
+        self.rows = 0
+        self.tz = None
+
+    def update(self, returns, benchmark):
+        """
+        Commits the bars of `returns` after the last committed one.
+
+        Args:
+            returns (pd.Series): Daily returns of the symbol, sorted by date.
+            benchmark (pd.Series): Daily returns of the benchmark.
+
+        Returns:
+            tuple: (reset, dates, points, latest) where reset tells whether the state was rebuilt,
+                dates (int64 ns) and points hold the newly committed rows, and latest is the
+                (timestamp, point) of the uncommitted latest bar.
+        """
+        index = returns.index
+        start = 0
+        reset = False
+        if self.last is not None:
+            position = index.searchsorted(self.last)
+            if position >= len(index) - 1 or index[position] != self.last \
+                    or self._values_at(returns, benchmark, position) != self.last_values:
+                self.reset()
+                reset = True
+            else:
+                start = position + 1
+        if self.last is None:
+            self.tz = str(index.tz) if index.tz is not None else None
+
+        # only the bars after the last committed one are touched
+        tail = returns.iloc[start:]
+        values = _clean(tail.to_numpy())
+        benches = _clean(benchmark.reindex(tail.index).to_numpy())
+        points = np.array(
+            [self._append(self.windows, values[i], benches[i]) for i in range(len(tail) - 1)],
+            dtype="float64"
+        ).reshape(-1, len(self.columns))
+        if len(tail) > 1:
+            self.last = tail.index[-2]
+            self.last_values = (float(values[-2]), float(benches[-2]))
+            self.rows += len(points)
+
+        latest = None
+        if len(tail):
+            latest = (tail.index[-1], self._append(copy.deepcopy(self.windows), values[-1], benches[-1]))
+        return reset, _as_ns(tail.index[:-1]), points, latest
+
+    @staticmethod
+    def _values_at(returns, benchmark, position):
+        bench = benchmark.reindex(returns.index[position:position + 1])
+        return float(_clean(returns.iloc[position])), float(_clean(bench.iloc[0]))
+
+    @staticmethod
+    def _append(windows, value, bench):
+        point = []
+        for window in windows.values():
+            window.append(float(value), float(bench))
+            point.extend(window.metrics())
+        return tuple(point)
+
+
+class RollingStore:
+    """
+    Rolling states with their metric history, per symbol and benchmark, shared by the worker processes.
+
+    The small state is pickled in a diskcache; the metric history is an append-only file of fixed-size
+    records (timestamp and one float64 per metric), so committing a bar writes one record. The state's
+    row count marks how many records are valid, which makes a write interrupted between the two safe.
+    """
+
+    def __init__(self, directory, windows):
+        self.directory = directory
+        self.windows = tuple(windows)
+        self._states = Cache(directory)
+
+    def update(self, key, returns, benchmark):
+        """
+        Extends the state of `key` with new bars.
+
+        Returns:
+            tuple: (state, latest) where latest is the (timestamp, point) of the uncommitted latest bar.
+        """
+        with Lock(self._states, ("lock", key), expire=60):
+            state = self._states.get(key) or RollingState(self.windows)
+            reset, dates, points, latest = state.update(returns, benchmark)
+            if reset or len(dates):
+                self._append(key, state.rows - len(dates), dates, points, state.columns)
+                self._states[key] = state
+        return state, latest
+
+    def series(self, key, state, latest=None):
+        """Committed metric history of `key` plus the latest bar, as a DataFrame."""
+        path = self._path(key)
+        rows = state.rows if os.path.exists(path) else 0
+        records = np.memmap(path, dtype=self._dtype(state.columns), mode="r", shape=(rows,)) if rows \
+            else np.empty(0, dtype=self._dtype(state.columns))
+        index = pd.DatetimeIndex(records["date"].view("datetime64[ns]"))
+        if state.tz:
+            index = index.tz_localize("UTC").tz_convert(state.tz)
+        frame = pd.DataFrame({column: records[column] for column in state.columns}, index=index)
+        if latest is not None:
+            frame.loc[latest[0]] = latest[1]
+        return frame
+
+    def _append(self, key, start, dates, points, columns):
+        dtype = self._dtype(columns)
+        records = np.empty(len(dates), dtype=dtype)
+        records["date"] = dates
+        for i, column in enumerate(columns):
+            records[column] = points[:, i]
+
+        path = self._path(key)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(start * dtype.itemsize)
+            f.write(records.tobytes())
+            f.truncate()
+
+    def _path(self, key):
+        return os.path.join(self.directory, re.sub(r"[^\w.-]", "_", key) + ".bin")
+
+    @staticmethod
+    def _dtype(columns):
+        return np.dtype([("date", "int64")] + [(column, "float64") for column in columns])
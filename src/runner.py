@@ -1,7 +1,30 @@
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from src import DOWNLOAD_WORKERS
 from src.factory import ChainFactory
-from src.services import extract_companies_from_text, get_ticker_from_name, extract_mentioned_topics
-from src.ticker import TickerInfo
+from src.screener import NUMERIC_FIELDS, universe_snapshot
+from src.services import extract_companies_from_text, get_ticker_from_name, extract_mentioned_topics, \
+    extract_screen_from_text
+from src.statements import STATEMENTS
+from src.ticker import TickerInfo, cache_usage
+
+_download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download")
+# Topics answered from the whole universe rather than per company
+UNIVERSE_TOPICS = {"stock_screener"}
+# Topics whose answer depends on the question (screens, statement line items), never reused
+QUESTION_TOPICS = UNIVERSE_TOPICS | set(STATEMENTS)
+
+
+class Deadline:
+    """Latency budget shared by every stage handling one message."""
+
+    def __init__(self, budget):
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
 
 
 def get_companies_from_query(query: str):
@@ -20,16 +43,62 @@ def clarify_query_topics(query: str):
     return topics
 
 
-def download_data(topics, companies):
-    for topic in topics:
-        for company in companies:
-            data, fig = getattr(TickerInfo, topic)(**company)
-            logging.info(f"Download data {topic}, {company} ===>>>> {data}")
-            yield data, fig
+def get_screen_from_query(query: str):
+    chain = ChainFactory.create_screener_chain(NUMERIC_FIELDS, universe_snapshot.sectors())
+    result = chain.invoke(query)
+    return extract_screen_from_text(result)
+
+
+def _download(topic, company, deadline):
+    kwargs = dict(company)
+    if deadline is not None:
+        # yfinance calls that accept a timeout get what is left, so late calls release the worker
+        kwargs["timeout"] = deadline.remaining()
+        if kwargs["timeout"] <= 0:
+            raise TimeoutError(f"{topic} started after the deadline")
+    data, fig = getattr(TickerInfo, topic)(**kwargs)
+    logging.info(f"Download data {topic}, {company} ===>>>> {data}")
+    return data, fig
+
+
+def download_pairs(pairs, timeout=None):
+    """
+    Downloads (topic, company) pairs concurrently.
+
+    Args:
+        pairs (list): (topic, company) pairs, company as returned by get_ticker_from_name.
+        timeout (float): Seconds to wait before giving up on unfinished downloads.
+
+    Returns:
+        tuple: (results, missing) where results maps (topic, symbol) to the (data, fig) that arrived
+            in time and missing lists the topic/symbol pairs that failed or missed the deadline.
+    """
+    deadline = Deadline(timeout) if timeout is not None else None
+    futures = {
+        _download_executor.submit(_download, topic, company, deadline): (topic, company)
+        for topic, company in pairs
+    }
+    done, _ = wait(futures, timeout=timeout)
+
+    results, missing = {}, []
+    for future, (topic, company) in futures.items():
+        if future in done and future.exception() is None:
+            results[(topic, company.get("symbol"))] = future.result()
+            continue
+
+        if future in done:
+            logging.error(f"Failed to download {topic}, {company}: {future.exception()}")
+        else:
+            # Queued work is dropped, running work finishes in the background and is discarded
+            future.cancel()
+            logging.warning(f"Download {topic}, {company} missed the deadline")
+        missing.append({"topic": topic, "symbol": company.get("symbol")})
+    logging.info(f"Cache bytes in use: {cache_usage()}")
+    return results, missing
 
 
-def synthesise_query_result_chain(companies, data):
-    chain = ChainFactory.create_synthetic_chain(companies, data)
+def synthesise_query_result_chain(companies, data, missing=None):
+    chain = ChainFactory.create_synthetic_chain(companies, data, missing or [])
     return chain
 
 
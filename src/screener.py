@@ -0,0 +1,210 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import yfinance as yf
+from diskcache import Cache
+
+from src import CACHE_DIR, DOWNLOAD_WORKERS, SCREENER_UNIVERSE, SCREENER_REFRESH_INTERVAL
+
+TEXT_FIELDS = ["shortName", "sector", "industry", "currency"]
+NUMERIC_FIELDS = [
+    "marketCap", "currentPrice", "forwardPE", "trailingPE", "pegRatio", "priceToBook",
+    "priceToSalesTrailing12Months", "enterpriseToEbitda", "dividendYield", "beta",
+    "returnOnEquity", "profitMargins", "revenueGrowth", "earningsGrowth", "debtToEquity",
+]
+# valuation ratios where a negative value means losses rather than a cheap stock
+POSITIVE_ONLY_FIELDS = {"forwardPE", "trailingPE", "pegRatio", "priceToBook", "enterpriseToEbitda"}
+GROUP_FIELDS = {"sector", "industry"}
+# a refresh losing more of the universe than this (rate limits, outages) is retried after RETRY_INTERVAL seconds
+MAX_FAILED_SHARE = 0.2
+RETRY_INTERVAL = 15 * 60
+
+
+def load_universe(universe=SCREENER_UNIVERSE):
+    """Symbols of a universe given as a comma separated list or the URL of a CSV with a Symbol column."""
+    if universe.startswith("http"):
+        symbols = pd.read_csv(universe)["Symbol"]
+        return symbols.str.replace(".", "-", regex=False).tolist()
+    return [symbol.strip() for symbol in universe.split(",") if symbol.strip()]
+
+
+def _fetch_info(symbol):
+    try:
+        info = yf.Ticker(symbol).info
+    except Exception as ex:
+        logging.error(f"Failed to fetch info for {symbol}: {ex}")
+        return None
+    return {"symbol": symbol, **{field: info.get(field) for field in TEXT_FIELDS + NUMERIC_FIELDS}}
+
+
+class UniverseSnapshot:
+    """
+    Columnar snapshot of info fields for every symbol in a universe, shared by the worker processes.
+
+    The snapshot is a pickled DataFrame refreshed in a background thread once it is older than
+    `refresh_interval`, while the stale one keeps serving. A diskcache entry acts as a non-blocking
+    lock so only one process rebuilds it at a time. A refresh where too many symbols failed keeps
+    the previous snapshot and is retried sooner.
+    """
+
+    def __init__(self, directory, universe=SCREENER_UNIVERSE, refresh_interval=SCREENER_REFRESH_INTERVAL):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "snapshot.pkl")
+        self.universe = universe
+        self.refresh_interval = refresh_interval
+        self._locks = Cache(directory)
+        self._frame = None
+        self._mtime = None
+        self._guard = threading.Lock()
+        self._refresher = None
+
+    def frame(self):
+        """Latest snapshot, or None while the first one is being built."""
+        mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        if mtime is not None and mtime != self._mtime:
+            self._frame, self._mtime = pd.read_pickle(self.path), mtime
+        if mtime is None or time.time() - mtime > self.refresh_interval:
+            self._refresh_in_background()
+        return self._frame
+
+    def sectors(self):
+        frame = self.frame()
+        return [] if frame is None else sorted(frame["sector"].dropna().unique().tolist())
+
+    def _refresh_in_background(self):
+        with self._guard:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self.refresh, name="universe-snapshot", daemon=True)
+            self._refresher.start()
+
+    def refresh(self):
+        # a rebuild takes minutes, other processes keep serving the stale snapshot instead of waiting
+        if not self._locks.add("refresh", None, expire=3600):
+            return
+        try:
+            self._rebuild()
+        finally:
+            self._locks.delete("refresh")
+
+    def _rebuild(self):
+        # another process may have rebuilt the snapshot before we took the lock
+        if os.path.exists(self.path) and time.time() - os.path.getmtime(self.path) <= self.refresh_interval:
+            return
+
+        symbols = load_universe(self.universe)
+        logging.info(f"Refresh universe snapshot of {len(symbols)} symbols")
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            records = [record for record in executor.map(_fetch_info, symbols) if record is not None]
+
+        failed = 1 - len(records) / max(len(symbols), 1)
+        if failed > MAX_FAILED_SHARE and os.path.exists(self.path):
+            logging.warning(f"{failed:.0%} of the universe failed to fetch, keeping the previous snapshot")
+            self._retry_soon()
+            return
+
+        frame = pd.DataFrame.from_records(records, columns=["symbol"] + TEXT_FIELDS + NUMERIC_FIELDS)
+        frame = frame.set_index("symbol")
+        frame[TEXT_FIELDS] = frame[TEXT_FIELDS].astype("category")
+        frame[NUMERIC_FIELDS] = frame[NUMERIC_FIELDS].apply(pd.to_numeric, errors="coerce")
+        frame.to_pickle(self.path + ".tmp")
+        os.replace(self.path + ".tmp", self.path)
+        if failed > MAX_FAILED_SHARE:
+            # nothing better to serve yet, use the partial snapshot but rebuild it soon
+            logging.warning(f"{failed:.0%} of the universe failed to fetch, the snapshot is partial")
+            self._retry_soon()
+
+    def _retry_soon(self):
+        # backdate the snapshot so it turns stale after RETRY_INTERVAL rather than refresh_interval
+        stale_at = time.time() - self.refresh_interval + min(RETRY_INTERVAL, self.refresh_interval)
+        os.utime(self.path, (stale_at, stale_at))
+
+
+_MAGNITUDES = {"k": 1e3, "m": 1e6, "b": 1e9, "t": 1e12}
+
+
+def _as_number(value):
+    """Number from an LLM field such as 10000000000, "10B", "$2.5 trillion" or "1,500,000", else None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    match = re.fullmatch(r"\$?\s*([-+]?\d+(?:\.\d+)?)\s*([a-z]*)", str(value).strip().lower().replace(",", ""))
+    if match is None:
+        return None
+    number, suffix = float(match.group(1)), match.group(2)
+    if not suffix:
+        return number
+    # "b", "bn" and "billion" all scale by their first letter
+    scale = _MAGNITUDES.get(suffix[:1])
+    return number * scale if scale else None
+
+
+def _as_bool(value, default):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("true", "yes", "1", "asc", "ascending"):
+        return True
+    if text in ("false", "no", "0", "desc", "descending"):
+        return False
+    return default
+
+
+def screen_universe(frame, screen):
+    """
+    Filters, ranks and aggregates the snapshot with vectorised column operations.
+
+    Args:
+        frame (pd.DataFrame): Universe snapshot.
+        screen (dict): Screen with optional keys sector, industry, min_market_cap, max_market_cap,
+            sort_by, ascending, limit and group_by.
+
+    Returns:
+        dict: The matching companies ranked by sort_by and, if requested, per group statistics.
+    """
+    # the screen comes from an LLM, fields it got wrong fall back to their defaults
+    sort_by = screen.get("sort_by") if screen.get("sort_by") in NUMERIC_FIELDS else "marketCap"
+    ascending = _as_bool(screen.get("ascending"), False)
+    limit = _as_number(screen.get("limit"))
+    limit = 10 if limit is None else min(max(int(limit), 1), 50)
+    min_market_cap = _as_number(screen.get("min_market_cap"))
+    max_market_cap = _as_number(screen.get("max_market_cap"))
+
+    mask = frame[sort_by].notna()
+    if screen.get("sector"):
+        mask &= frame["sector"].astype(str).str.lower() == str(screen["sector"]).lower()
+    if screen.get("industry"):
+        mask &= frame["industry"].astype(str).str.contains(str(screen["industry"]), case=False, regex=False)
+    if min_market_cap:
+        mask &= frame["marketCap"] >= min_market_cap
+    if max_market_cap:
+        mask &= frame["marketCap"] <= max_market_cap
+    if sort_by in POSITIVE_ONLY_FIELDS:
+        mask &= frame[sort_by] > 0
+
+    matches = frame[mask]
+    columns = list(dict.fromkeys(["shortName", "sector", "industry", "marketCap", sort_by]))
+    ranked = matches.sort_values(sort_by, ascending=ascending).head(limit)[columns]
+    result = {
+        "screen": {**screen, "sort_by": sort_by, "ascending": ascending, "limit": limit,
+                   "min_market_cap": min_market_cap, "max_market_cap": max_market_cap},
+        "universe_size": len(frame),
+        "matches": len(matches),
+        "results": ranked.reset_index().to_dict(orient="records"),
+    }
+
+    group_by = screen.get("group_by")
+    if group_by in GROUP_FIELDS:
+        groups = matches.groupby(group_by, observed=True)[sort_by].agg(["count", "median", "mean"])
+        result["groups"] = groups.round(2).reset_index().to_dict(orient="records")
+    return result
+
+
+universe_snapshot = UniverseSnapshot(os.path.join(CACHE_DIR, "screener"))
@@ -1,15 +1,15 @@
+import json
 from functools import cache
 
 import requests
 
-from src import YAHOO_FIN_SEARCH_BASE, DEFAULT_USER_AGENT
+from src import YAHOO_FIN_SEARCH_BASE, DEFAULT_USER_AGENT, CACHE_DIR
 from src.ticker import TickerInfo
 import re
 import os
 from diskcache import Cache
 
 
-CACHE_DIR = ".cache"
 os.makedirs(CACHE_DIR, exist_ok=True)
 _disk_cache = Cache(CACHE_DIR)  # Specify the directory where cache data will be stored
 
@@ -32,6 +32,18 @@ def extract_companies_from_text(text):
     return list(set(companies))
 
 
+def extract_screen_from_text(text):
+    # The screen is the first JSON object in the text
+    match = re.search(r'\{.*?\}', text, re.DOTALL)
+    if match is None:
+        return {}
+    try:
+        screen = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    return screen if isinstance(screen, dict) else {}
+
+
 @cache
 def list_all_topics():
     methods = []
@@ -46,9 +58,10 @@ def list_all_topics():
 
 
 def extract_mentioned_topics(text, top=3):
-    topics = list_all_topics()
-    mentioned_topics = [topic for topic in topics if topic in text]
-    return mentioned_topics[:top]
+    topics = set(list_all_topics())
+    # whole tokens only, so "quarterly_cashflow" does not also match "cashflow"
+    mentioned_topics = dict.fromkeys(token for token in re.findall(r"\b\w+\b", text) if token in topics)
+    return list(mentioned_topics)[:top]
 
 
 def get_ticker_from_name(name):
@@ -88,3 +101,10 @@ def get_ticker_from_name(name):
         return result
     except (KeyError, IndexError):
         return None
+
+
+if __name__ == "__main__":
+    # Example usage: topics are matched as whole tokens, in the order they are mentioned
+    print(extract_mentioned_topics("quarterly_income_stmt"))
+    assert extract_mentioned_topics("quarterly_income_stmt") == ["quarterly_income_stmt"]
+    print(extract_mentioned_topics("Topics: cashflow, quarterly_cashflow"))
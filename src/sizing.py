@@ -0,0 +1,40 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+def _package(value):
+    return type(value).__module__.split(".")[0]
+
+
+def sizeof(value, _seen=None, _root=None):
+    """
+    Approximate deep memory footprint of a cached value in bytes.
+
+    Pandas and numpy payloads are measured with memory_usage/nbytes. Plain objects are only
+    followed into attributes defined by the same package as the cached value, so shared
+    helpers such as HTTP sessions are counted once as a shallow size rather than per entry.
+    """
+    seen = set() if _seen is None else _seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    root = _package(value) if _root is None else _root
+
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+
+    size = sys.getsizeof(value)
+    # iterate over snapshots, other threads may still be filling the containers
+    if isinstance(value, dict):
+        size += sum(sizeof(k, seen, root) + sizeof(v, seen, root) for k, v in list(value.items()))
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sizeof(v, seen, root) for v in list(value))
+    elif hasattr(value, "__dict__") and _package(value) == root:
+        size += sizeof(vars(value), seen, root)
+    return size
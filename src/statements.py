@@ -0,0 +1,154 @@
+import datetime
+import logging
+import re
+
+import pandas as pd
+from diskcache import Cache
+
+from src import STATEMENT_PERIODS, HOLDER_ROWS
+
+QUARTER = datetime.timedelta(days=92)
+YEAR = datetime.timedelta(days=366)
+# Line items reported when the question names none of the statement's items
+_INCOME_ITEMS = ["Total Revenue", "Gross Profit", "Operating Income", "Net Income", "EBITDA", "Diluted EPS"]
+_BALANCE_ITEMS = ["Total Assets", "Total Liabilities Net Minority Interest", "Stockholders Equity",
+                  "Cash And Cash Equivalents", "Total Debt"]
+_CASHFLOW_ITEMS = ["Operating Cash Flow", "Capital Expenditure", "Free Cash Flow",
+                   "Repurchase Of Capital Stock", "Cash Dividends Paid"]
+# name: (period length, filing lag after the period ends, default items)
+STATEMENTS = {
+    "income_stmt": (YEAR, datetime.timedelta(days=90), _INCOME_ITEMS),
+    "quarterly_income_stmt": (QUARTER, datetime.timedelta(days=45), _INCOME_ITEMS),
+    "balance_sheet": (YEAR, datetime.timedelta(days=90), _BALANCE_ITEMS),
+    "quarterly_balance_sheet": (QUARTER, datetime.timedelta(days=45), _BALANCE_ITEMS),
+    "cashflow": (YEAR, datetime.timedelta(days=90), _CASHFLOW_ITEMS),
+    "quarterly_cashflow": (QUARTER, datetime.timedelta(days=45), _CASHFLOW_ITEMS),
+}
+# holdings are filed quarterly (13F), refetch them once a quarter
+HOLDERS = ["major_holders", "institutional_holders", "mutualfund_holders",
+           "insider_transactions", "insider_purchases", "insider_roster_holders"]
+# once a filing is due but not out yet, check again at most this often
+RETRY_INTERVAL = datetime.timedelta(days=1)
+
+
+def _json_value(value):
+    # NaN, NaT and None alike, so missing dates do not serialise as "NaT"
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+class StatementStore:
+    """
+    Financial statements and holder tables persisted on disk, fetched at most once per reporting period.
+
+    Statements are stored one line item per key, as a tuple of values aligned with the periods kept
+    in the statement's meta entry. Questions then only load and serialise the line items and periods
+    they ask for. Holder tables are small and stored whole.
+    """
+
+    def __init__(self, directory, fetch):
+        self._cache = Cache(directory)
+        self._fetch = fetch
+
+    def statement(self, symbol, name, question=""):
+        meta = self._statement_meta(symbol, name)
+        items = self._select_items(meta["items"], STATEMENTS[name][2], question)
+        periods = self._select_periods(meta["periods"], question)
+        data = {}
+        for item in items:
+            values = self._cache.get((symbol, name, meta["fetched_at"], item))
+            if values is None:
+                continue
+            data[item] = {
+                meta["periods"][i].date().isoformat(): _json_value(values[i]) for i in periods
+            }
+        return data
+
+    def holders(self, symbol, name):
+        key = (symbol, name)
+        table = self._cache.get(key)
+        now = datetime.datetime.now()
+        if table is None or now - table["fetched_at"] >= QUARTER:
+            logging.info(f"Fetch {name} of {symbol}")
+            frame = self._fetch(symbol, name)
+            if frame is None:
+                frame = pd.DataFrame()
+            elif frame.index.name is not None:
+                # named indexes carry data (e.g. the holder breakdown), default RangeIndexes do not
+                frame = frame.reset_index()
+            table = {
+                "fetched_at": now,
+                "columns": [str(c) for c in frame.columns],
+                "rows": [[_json_value(v) for v in row] for row in frame.itertuples(index=False)],
+            }
+            self._cache[key] = table
+        return [dict(zip(table["columns"], row)) for row in table["rows"][:HOLDER_ROWS]]
+
+    def _statement_meta(self, symbol, name):
+        meta = self._cache.get((symbol, name))
+        if meta is not None and not self._is_stale(meta, name):
+            return meta
+
+        logging.info(f"Fetch {name} of {symbol}")
+        frame = self._fetch(symbol, name)
+        if frame is None:
+            frame = pd.DataFrame()
+        frame = frame.dropna(how="all").dropna(axis=1, how="all")
+        periods = [pd.Timestamp(c) for c in frame.columns]
+        order = sorted(range(len(periods)), key=periods.__getitem__)
+
+        # items are written under a new version before the meta entry switches to it,
+        # so readers in other processes never mix periods of two fetches
+        version = datetime.datetime.now()
+        for item, row in frame.iterrows():
+            values = row.to_numpy(dtype="float64")
+            self._cache[(symbol, name, version, str(item))] = tuple(float(values[i]) for i in order)
+        new_meta = {
+            "fetched_at": version,
+            "periods": [periods[i] for i in order],
+            "items": [str(item) for item in frame.index],
+        }
+        self._cache[(symbol, name)] = new_meta
+        if meta is not None:
+            for item in meta["items"]:
+                self._cache.delete((symbol, name, meta["fetched_at"], item))
+        return new_meta
+
+    @staticmethod
+    def _is_stale(meta, name):
+        period, lag, _ = STATEMENTS[name]
+        now = datetime.datetime.now()
+        if now - meta["fetched_at"] < RETRY_INTERVAL:
+            return False
+        if not meta["periods"]:
+            return True
+        # the next filing covers the period after the latest one and is due `lag` after it ends
+        due = meta["periods"][-1].to_pydatetime().replace(tzinfo=None) + period + lag
+        return now >= due
+
+    @staticmethod
+    def _select_items(items, defaults, question):
+        text = question.lower()
+        spans = {}
+        for item in items:
+            # whole words only, so "ebitda" does not also select "EBIT"
+            for name in (item.lower(), re.sub(r"^total ", "", item.lower())):
+                match = re.search(rf"\b{re.escape(name)}\b", text)
+                if match is not None:
+                    spans[item] = match.span()
+                    break
+        # the longest item wins, "operating revenue" names Operating Revenue and not Total Revenue
+        named = [
+            item for item, (start, end) in spans.items()
+            if not any(s <= start and end <= e and (s, e) != (start, end) for s, e in spans.values())
+        ]
+        return named or [item for item in defaults if item in items]
+
+    @staticmethod
+    def _select_periods(periods, question):
+        years = set(re.findall(r"\b((?:19|20)\d{2})\b", question))
+        selected = [i for i, period in enumerate(periods) if str(period.year) in years]
+        return selected or list(range(len(periods)))[-STATEMENT_PERIODS:]
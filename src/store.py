@@ -0,0 +1,176 @@
+import logging
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from diskcache import Cache
+
+
+class SharedFrameStore:
+    """
+    Numeric Series/DataFrames stored in memory-mapped files shared by every worker process.
+
+    Each entry is one file holding the int64 timestamps followed by each column in its own numeric
+    dtype, laid out column by column. A small diskcache index maps the key to the file, the column
+    offsets and the metadata needed to rebuild the pandas object, so all processes map the same
+    pages instead of keeping a private copy of each series. Non-numeric columns are stored as float64.
+
+    Files are bounded by max_bytes: writes evict the least recently used entries until the new
+    entry fits. Access times are shared through a second index and refreshed at most once per
+    ACCESS_RESOLUTION seconds to keep reads free of disk writes. Each write also drops this
+    process's views of entries other workers evicted, so their files are not kept alive.
+    """
+    ACCESS_RESOLUTION = 60
+
+    def __init__(self, directory, ttl=3600, max_bytes=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._index = Cache(os.path.join(directory, "index"))
+        self._access = Cache(os.path.join(directory, "access"))
+        # per-process views over the shared files, with the file each one maps
+        self._views = {}
+
+    @property
+    def currsize(self):
+        """Bytes currently held by the store files."""
+        return sum(entry["nbytes"] for entry in self._entries().values())
+
+    def get(self, key, ttl=None):
+        entry = self._index.get(key)
+        if entry is None or time.time() - entry["written_at"] > (ttl or self.ttl):
+            self._views.pop(key, None)
+            return None
+        self._touch(key)
+
+        view = self._views.get(key)
+        if view is not None and view[0] == entry["file"]:
+            return view[1]
+        try:
+            value = self._load(entry)
+        except (FileNotFoundError, ValueError, KeyError) as ex:
+            # another worker replaced the entry between reading the index and mapping the file,
+            # or the entry was written by an older layout
+            logging.warning(f"Failed to map shared entry {key}: {ex}")
+            return None
+        self._views[key] = (entry["file"], value)
+        return value
+
+    def put(self, key, value):
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        index = pd.DatetimeIndex(frame.index)
+        tz = str(index.tz) if index.tz is not None else None
+        dates = index.tz_convert("UTC").tz_localize(None) if tz else index
+        dates = dates.to_numpy(dtype="datetime64[ns]").view("int64")
+        columns = [
+            np.ascontiguousarray(column.to_numpy(
+                dtype=column.dtype if isinstance(column.dtype, np.dtype) and column.dtype.kind in "biuf" else "float64"
+            ))
+            for _, column in frame.items()
+        ]
+
+        nbytes = dates.nbytes + sum(column.nbytes for column in columns)
+        self._prune_views()
+        if self.max_bytes is not None:
+            if nbytes > self.max_bytes:
+                logging.warning(f"Entry {key} ({nbytes} bytes) exceeds the store budget, not shared")
+                return value
+            self._evict(self.max_bytes - nbytes, keep=key)
+
+        layout, offset = [], dates.nbytes
+        file = f"{uuid.uuid4().hex}.bin"
+        path = os.path.join(self.directory, file)
+        with open(path + ".tmp", "wb") as f:
+            f.write(dates.tobytes())
+            for column in columns:
+                f.write(column.tobytes())
+                layout.append((column.dtype.str, offset))
+                offset += column.nbytes
+        os.replace(path + ".tmp", path)
+
+        previous = self._index.get(key)
+        self._index[key] = {
+            "file": file,
+            "rows": len(dates),
+            "columns": [str(c) for c in frame.columns],
+            "layout": layout,
+            "name": value.name if isinstance(value, pd.Series) else None,
+            "series": isinstance(value, pd.Series),
+            "index_name": frame.index.name,
+            "tz": tz,
+            "nbytes": nbytes,
+            "written_at": time.time(),
+        }
+        if previous is not None:
+            # processes still mapping the old file keep their pages until they drop the view
+            self._remove_file(previous["file"])
+        # the entry can already be evicted by another worker, the caller still gets its data
+        shared = self.get(key)
+        return value if shared is None else shared
+
+    def _entries(self):
+        entries = {}
+        for key in self._index.iterkeys():
+            entry = self._index.get(key)
+            if entry is not None:
+                entries[key] = entry
+        return entries
+
+    def _touch(self, key):
+        now = time.time()
+        if now - self._access.get(key, 0) > self.ACCESS_RESOLUTION:
+            self._access[key] = now
+
+    def _prune_views(self):
+        # other workers evict and replace entries too, drop the views that pin their removed files
+        for key, (file, _) in list(self._views.items()):
+            entry = self._index.get(key)
+            if entry is None or entry["file"] != file:
+                del self._views[key]
+
+    def _evict(self, budget, keep=None):
+        entries = self._entries()
+        used = sum(entry["nbytes"] for key, entry in entries.items() if key != keep)
+        lru = sorted(
+            (key for key in entries if key != keep),
+            key=lambda k: self._access.get(k, entries[k]["written_at"])
+        )
+        for key in lru:
+            if used <= budget:
+                break
+            entry = entries[key]
+            self._index.delete(key)
+            self._access.delete(key)
+            self._views.pop(key, None)
+            self._remove_file(entry["file"])
+            used -= entry["nbytes"]
+            logging.info(f"Evicted shared entry {key} ({entry['nbytes']} bytes), {used} bytes in use")
+
+    def _load(self, entry):
+        path = os.path.join(self.directory, entry["file"])
+        rows, columns = entry["rows"], entry["columns"]
+        if rows == 0:
+            dates = np.empty(0, dtype="int64")
+            values = [np.empty(0, dtype=dtype) for dtype, _ in entry["layout"]]
+        else:
+            dates = np.memmap(path, dtype="int64", mode="r", shape=(rows,))
+            values = [
+                np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(rows,))
+                for dtype, offset in entry["layout"]
+            ]
+
+        index = pd.DatetimeIndex(dates.view("datetime64[ns]"), name=entry["index_name"])
+        if entry["tz"]:
+            index = index.tz_localize("UTC").tz_convert(entry["tz"])
+        if entry["series"]:
+            return pd.Series(values[0], index=index, name=entry["name"], copy=False)
+        return pd.DataFrame(dict(zip(columns, values)), index=index, copy=False)
+
+    def _remove_file(self, file):
+        try:
+            os.remove(os.path.join(self.directory, file))
+        except FileNotFoundError:
+            pass
@@ -1,10 +1,22 @@
+import os
+import threading
+import zlib
+
 import yfinance as yf
 from cachetools import TTLCache
 import logging
 import quantstats as qs
 import plotly
-from cachetools.func import ttl_cache
 import plotly.graph_objects as go
+import plotly.io as pio
+from diskcache import Cache
+
+from src import CACHE_DIR, TICKER_CACHE_BYTES, SHARED_STORE_BYTES, FIGURE_CACHE_BYTES
+from src.rolling import RollingStore
+from src.screener import universe_snapshot, screen_universe
+from src.sizing import sizeof
+from src.statements import StatementStore
+from src.store import SharedFrameStore
 
 
 def to_plotly(fig):
@@ -16,25 +28,129 @@ def to_plotly(fig):
 
 
 class _TickerData:
-    # singleton cache for ticker data
-    _ticker_info_cache = TTLCache(maxsize=1024, ttl=60)
+    # singleton cache of (ticker, footprint, lock), bounded by the bytes held in each ticker's fetched data
+    _ticker_info_cache = TTLCache(maxsize=TICKER_CACHE_BYTES, ttl=60, getsizeof=lambda entry: entry[1])
+    _ticker_info_lock = threading.RLock()
+    # pyplot keeps global state, renders from concurrent downloads must not interleave
+    _plot_lock = threading.Lock()
+    # returns and price history shared with the other worker processes
+    _shared_store = SharedFrameStore(os.path.join(CACHE_DIR, "shared"), max_bytes=SHARED_STORE_BYTES)
+    # rendered charts as compressed plotly json, keyed by the data they were drawn from
+    _figure_cache = Cache(os.path.join(CACHE_DIR, "figures"), size_limit=FIGURE_CACHE_BYTES)
+    # rolling window accumulators per symbol, extended with each new bar instead of recomputed
+    _rolling_store = RollingStore(os.path.join(CACHE_DIR, "rolling"), (126, 252))
+    # statements and holders, fetched once per reporting period and loaded line item by line item
+    _statement_store = StatementStore(
+        os.path.join(CACHE_DIR, "statements"),
+        lambda symbol, name: _TickerData.get_data(symbol, name)
+    )
     FAST_INFO = ['currency', 'dayHigh', 'dayLow', 'exchange', 'fiftyDayAverage', 'lastPrice', 'lastVolume', 'marketCap', 'open', 'previousClose', 'quoteType', 'regularMarketPreviousClose', 'shares', 'tenDayAverageVolume', 'threeMonthAverageVolume', 'timezone', 'twoHundredDayAverage', 'yearChange', 'yearHigh', 'yearLow']
 
     @staticmethod
-    @ttl_cache(ttl=3600, maxsize=1024)
     def download_returns(symbol):
-        returns = qs.utils.download_returns(symbol)
+        key = f"returns:{symbol}"
+        returns = _TickerData._shared_store.get(key, ttl=3600)
+        if returns is None:
+            returns = _TickerData._shared_store.put(key, qs.utils.download_returns(symbol))
         return returns
 
+    @staticmethod
+    def get_history(symbol, period, timeout=10):
+        key = f"history:{symbol}:{period}"
+        history = _TickerData._shared_store.get(key, ttl=60)
+        if history is None:
+            history = _TickerData.get_data(symbol, "history")(period=period, timeout=timeout)
+            history = _TickerData._shared_store.put(key, history)
+        return history
+
     @staticmethod
     def get_data(symbol, method_name):
-        if symbol not in _TickerData._ticker_info_cache:
-            logging.info(f"Create ticker {symbol}")
-            _TickerData._ticker_info_cache[symbol] = yf.Ticker(symbol)
+        with _TickerData._ticker_info_lock:
+            entry = _TickerData._ticker_info_cache.get(symbol)
+            if entry is None:
+                logging.info(f"Create ticker {symbol}")
+                entry = (yf.Ticker(symbol), 0, threading.Lock())
+                _TickerData._ticker_info_cache[symbol] = entry
+        ticker, _, ticker_lock = entry
 
-        values = getattr(_TickerData._ticker_info_cache[symbol], method_name)
+        # topics of one symbol run concurrently, the first one fetches and the others reuse the
+        # data yfinance memoises on the ticker; measuring also needs the ticker to stop changing
+        with ticker_lock:
+            values = getattr(ticker, method_name)
+            _TickerData._cache_ticker(symbol, ticker, ticker_lock, sizeof(ticker))
         return values
 
+    @staticmethod
+    def _cache_ticker(symbol, ticker, ticker_lock, footprint):
+        with _TickerData._ticker_info_lock:
+            current = _TickerData._ticker_info_cache.get(symbol)
+            # tickers grow as they fetch data, re-insert only then so reads do not refresh the TTL
+            if current is not None and (current[0] is not ticker or current[1] == footprint):
+                return
+            try:
+                _TickerData._ticker_info_cache[symbol] = (ticker, footprint, ticker_lock)
+            except ValueError:
+                # larger than the whole budget, keep it for this call only
+                _TickerData._ticker_info_cache.pop(symbol, None)
+                logging.warning(f"Ticker {symbol} ({footprint} bytes) exceeds the ticker cache budget")
+
+    @staticmethod
+    def cache_usage():
+        """Bytes currently used by the ticker cache and the shared returns store."""
+        with _TickerData._ticker_info_lock:
+            tickers = _TickerData._ticker_info_cache.currsize
+        return {
+            "tickers": tickers,
+            "shared": _TickerData._shared_store.currsize,
+        }
+
+    @staticmethod
+    def cached_figure(key, render):
+        blob = _TickerData._figure_cache.get(key)
+        if blob is not None:
+            return pio.from_json(zlib.decompress(blob).decode())
+
+        fig = render()
+        if fig is not None:
+            _TickerData._figure_cache.set(key, zlib.compress(fig.to_json().encode()))
+        return fig
+
+    @staticmethod
+    def plot_returns(symbol, title, plot, **kwargs):
+        returns = _TickerData.download_returns(symbol)
+
+        def render():
+            with _TickerData._plot_lock:
+                fig = plot(returns, show=False, **kwargs)
+                fig.title = title
+                return to_plotly(fig)
+
+        # the latest bar is revised during the session, so its value is part of the key
+        key = (symbol, plot.__name__, str(returns.index.max()), returns.iloc[-1:].tolist(), title, sorted(kwargs.items()))
+        return _TickerData.cached_figure(repr(key), render)
+
+    @staticmethod
+    def plot_rolling(symbol, title, lines, benchmark='SPY'):
+        key = f"{symbol}:{benchmark}"
+        state, latest = _TickerData._rolling_store.update(
+            key, _TickerData.download_returns(symbol), _TickerData.download_returns(benchmark)
+        )
+        columns = [state.columns.index(column) for column in lines]
+
+        def render():
+            # the full history is only read when the figure is not cached yet
+            metrics = _TickerData._rolling_store.series(key, state, latest)
+            fig = go.Figure()
+            for column, label in lines.items():
+                fig.add_trace(go.Scatter(x=metrics.index, y=metrics[column], mode="lines", name=label))
+            fig.add_hline(y=metrics[next(iter(lines))].mean(), line_dash="dash")
+            fig.update_layout(title=title)
+            return fig
+
+        last = (str(latest[0]), [latest[1][i] for i in columns]) if latest is not None else None
+        key = (symbol, "rolling", tuple(lines), state.rows, str(state.last), state.last_values, last, title)
+        return _TickerData.cached_figure(repr(key), render)
+
     @staticmethod
     def get_fast_info(symbol):
         info = _TickerData.get_data(symbol, "info")
@@ -44,6 +160,11 @@ class _TickerData:
         return fast_info
 
 
+def cache_usage():
+    """Bytes currently used by the ticker cache and the shared returns store."""
+    return _TickerData.cache_usage()
+
+
 class TickerInfo:
 
     @staticmethod
@@ -178,125 +299,228 @@ class TickerInfo:
 
     @staticmethod
     def show_stock_performance(**kwargs):
-        returns = _TickerData.download_returns(kwargs.get("symbol"))
-        fig = qs.plots.snapshot(returns, show=False)
-        fig.title = f'{kwargs.get("symbol")} Performance'
+        symbol = kwargs.get("symbol")
+        fig = _TickerData.plot_returns(symbol, f'{symbol} Performance', qs.plots.snapshot)
         return {
-            "symbol": kwargs.get("symbol"),
-            "data": _TickerData.get_fast_info(kwargs.get("symbol")),
-        }, to_plotly(fig)
+            "symbol": symbol,
+            "data": _TickerData.get_fast_info(symbol),
+        }, fig
 
     @staticmethod
     def show_stock_cumulative_returns(**kwargs):
-        returns = _TickerData.download_returns(kwargs.get("symbol"))
-        fig = qs.plots.returns(returns, show=False, benchmark=None)
-        fig.title = f'{kwargs.get("symbol")} Cumulative Returns'
+        symbol = kwargs.get("symbol")
+        fig = _TickerData.plot_returns(symbol, f'{symbol} Cumulative Returns', qs.plots.returns, benchmark=None)
         return {
-            "symbol": kwargs.get("symbol"),
-            "data": _TickerData.get_fast_info(kwargs.get("symbol")),
-        }, to_plotly(fig)
+            "symbol": symbol,
+            "data": _TickerData.get_fast_info(symbol),
+        }, fig
 
     @staticmethod
     def show_stock_log_returns(**kwargs):
-        returns = _TickerData.download_returns(kwargs.get("symbol"))
-        fig = qs.plots.log_returns(returns, show=False, benchmark=None)
-        fig.title = f'{kwargs.get("symbol")} Log Cumulative Returns'
+        symbol = kwargs.get("symbol")
+        fig = _TickerData.plot_returns(symbol, f'{symbol} Log Cumulative Returns', qs.plots.log_returns, benchmark=None)
         return {
-            "symbol": kwargs.get("symbol"),
-            "data": _TickerData.get_fast_info(kwargs.get("symbol")),
-        }, to_plotly(fig)
+            "symbol": symbol,
+            "data": _TickerData.get_fast_info(symbol),
+        }, fig
 
     @staticmethod
     def show_stock_daily_returns(**kwargs):
-        returns = _TickerData.download_returns(kwargs.get("symbol"))
-        fig = qs.plots.daily_returns(returns, show=False, benchmark=None)
-        fig.title = f'{kwargs.get("symbol")} Daily Returns'
+        symbol = kwargs.get("symbol")
+        fig = _TickerData.plot_returns(symbol, f'{symbol} Daily Returns', qs.plots.daily_returns, benchmark=None)
         return {
-            "symbol": kwargs.get("symbol"),
-            "data": _TickerData.get_fast_info(kwargs.get("symbol")),
-        }, to_plotly(fig)
+            "symbol": symbol,
+            "data": _TickerData.get_fast_info(symbol),
+        }, fig
 
     @staticmethod
     def show_stock_yearly_returns(**kwargs):
-        returns = _TickerData.download_returns(kwargs.get("symbol"))
-        fig = qs.plots.yearly_returns(returns, show=False, benchmark=None)
-        fig.title = f'{kwargs.get("symbol")} EOY Returns'
+        symbol = kwargs.get("symbol")
+        fig = _TickerData.plot_returns(symbol, f'{symbol} EOY Returns', qs.plots.yearly_returns, benchmark=None)
         return {
-            "symbol": kwargs.get("symbol"),
-            "data": _TickerData.get_fast_info(kwargs.get("symbol")),
-        }, to_plotly(fig)
+            "symbol": symbol,
+            "data": _TickerData.get_fast_info(symbol),
+        }, fig
 
     @staticmethod
     def show_stock_rolling_beta(**kwargs):
-        returns = _TickerData.download_returns(kwargs.get("symbol"))
-        fig = qs.plots.rolling_beta(returns, show=False, benchmark='SPY')
-        fig.title = f'{kwargs.get("symbol")} Rolling Beta To SPY'
+        symbol = kwargs.get("symbol")
+        fig = _TickerData.plot_rolling(symbol, f'{symbol} Rolling Beta To SPY', {"beta_126": "6-Months", "beta_252": "12-Months"})
         return {
-            "symbol": kwargs.get("symbol"),
-            "data": _TickerData.get_fast_info(kwargs.get("symbol")),
-        }, to_plotly(fig)
+            "symbol": symbol,
+            "data": _TickerData.get_fast_info(symbol),
+        }, fig
 
     @staticmethod
     def show_stock_rolling_sharpe(**kwargs):
-        returns = _TickerData.download_returns(kwargs.get("symbol"))
-        fig = qs.plots.rolling_sharpe(returns, show=False)
-        fig.title = f'{kwargs.get("symbol")} Rolling Sharpe (6-Months)'
+        symbol = kwargs.get("symbol")
+        fig = _TickerData.plot_rolling(symbol, f'{symbol} Rolling Sharpe (6-Months)', {"sharpe_126": "Sharpe"})
         return {
-            "symbol": kwargs.get("symbol"),
-            "data": _TickerData.get_fast_info(kwargs.get("symbol")),
-        }, to_plotly(fig)
+            "symbol": symbol,
+            "data": _TickerData.get_fast_info(symbol),
+        }, fig
 
     @staticmethod
     def show_stock_rolling_sortino(**kwargs):
-        returns = _TickerData.download_returns(kwargs.get("symbol"))
-        fig = qs.plots.rolling_sortino(returns, show=False)
-        fig.title = f'{kwargs.get("symbol")} Rolling Sortino (6-Months)'
+        symbol = kwargs.get("symbol")
+        fig = _TickerData.plot_rolling(symbol, f'{symbol} Rolling Sortino (6-Months)', {"sortino_126": "Sortino"})
         return {
-            "symbol": kwargs.get("symbol"),
-            "data": _TickerData.get_fast_info(kwargs.get("symbol")),
-        }, to_plotly(fig)
+            "symbol": symbol,
+            "data": _TickerData.get_fast_info(symbol),
+        }, fig
 
     @staticmethod
     def show_stock_rolling_volatility(**kwargs):
-        returns = _TickerData.download_returns(kwargs.get("symbol"))
-        fig = qs.plots.rolling_volatility(returns, show=False)
-        fig.title = f'{kwargs.get("symbol")} Rolling Volatility (6-Months)'
+        symbol = kwargs.get("symbol")
+        fig = _TickerData.plot_rolling(symbol, f'{symbol} Rolling Volatility (6-Months)', {"volatility_126": "Volatility"})
         return {
-            "symbol": kwargs.get("symbol"),
-            "data": _TickerData.get_fast_info(kwargs.get("symbol")),
-        }, to_plotly(fig)
+            "symbol": symbol,
+            "data": _TickerData.get_fast_info(symbol),
+        }, fig
 
     @staticmethod
     def show_stock_monthly_return_heatmap(**kwargs):
-        returns = _TickerData.download_returns(kwargs.get("symbol"))
-        fig = qs.plots.monthly_heatmap(returns, show=False)
-        fig.title = f'{kwargs.get("symbol")} Monthly Returns (%)'
+        symbol = kwargs.get("symbol")
+        fig = _TickerData.plot_returns(symbol, f'{symbol} Monthly Returns (%)', qs.plots.monthly_heatmap)
         return {
-            "symbol": kwargs.get("symbol"),
-            "data": _TickerData.get_fast_info(kwargs.get("symbol")),
-        }, to_plotly(fig)
+            "symbol": symbol,
+            "data": _TickerData.get_fast_info(symbol),
+        }, fig
 
     @staticmethod
     def show_ohlc_price_volume_history(**kwargs):
         symbol = kwargs.get("symbol")
-        data = _TickerData.get_data(symbol, "history")(period='2y').reset_index()
-        fig = go.Figure(
-            data=go.Ohlc(
-                x=data['Date'],
-                open=data['Open'],
-                high=data['High'],
-                low=data['Low'],
-                close=data['Close'])
-        )
-        title = f'{kwargs.get("symbol")} OHLC from {data.Date.min().strftime("%Y-%m-%d")} to {data.Date.max().strftime("%Y-%m-%d")}'
-        fig.update_layout(
-            title=title,
-        )
+        data = _TickerData.get_history(symbol, '2y', timeout=kwargs.get("timeout") or 10).reset_index()
+
+        def render():
+            fig = go.Figure(
+                data=go.Ohlc(
+                    x=data['Date'],
+                    open=data['Open'],
+                    high=data['High'],
+                    low=data['Low'],
+                    close=data['Close'])
+            )
+            title = f'{kwargs.get("symbol")} OHLC from {data.Date.min().strftime("%Y-%m-%d")} to {data.Date.max().strftime("%Y-%m-%d")}'
+            fig.update_layout(
+                title=title,
+            )
+            return fig
+
+        key = (symbol, "ohlc", str(data.Date.max()), data['Close'].iloc[-1:].tolist(), '2y')
+        fig = _TickerData.cached_figure(repr(key), render)
         return {
             "symbol": kwargs.get("symbol"),
             "data": f"{data.iloc[0].__str__()}\n-----\n{data.iloc[-1].__str__()}\n-----\nInfo: {_TickerData.get_fast_info(symbol)}",
         }, fig
 
+    @staticmethod
+    def stock_screener(**kwargs):
+        screen = kwargs.get("screen") or {}
+        frame = universe_snapshot.frame()
+        if frame is None:
+            return {
+                "screen": screen,
+                "error": "The universe snapshot is still being built, try again in a few minutes",
+            }, None
+        return screen_universe(frame, screen), None
+
+    @staticmethod
+    def income_stmt(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.statement(symbol, "income_stmt", kwargs.get("question", "")),
+        }, None
+
+    @staticmethod
+    def quarterly_income_stmt(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.statement(symbol, "quarterly_income_stmt", kwargs.get("question", "")),
+        }, None
+
+    @staticmethod
+    def balance_sheet(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.statement(symbol, "balance_sheet", kwargs.get("question", "")),
+        }, None
+
+    @staticmethod
+    def quarterly_balance_sheet(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.statement(symbol, "quarterly_balance_sheet", kwargs.get("question", "")),
+        }, None
+
+    @staticmethod
+    def cashflow(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.statement(symbol, "cashflow", kwargs.get("question", "")),
+        }, None
+
+    @staticmethod
+    def quarterly_cashflow(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.statement(symbol, "quarterly_cashflow", kwargs.get("question", "")),
+        }, None
+
+    @staticmethod
+    def major_holders(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.holders(symbol, "major_holders"),
+        }, None
+
+    @staticmethod
+    def institutional_holders(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.holders(symbol, "institutional_holders"),
+        }, None
+
+    @staticmethod
+    def mutualfund_holders(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.holders(symbol, "mutualfund_holders"),
+        }, None
+
+    @staticmethod
+    def insider_transactions(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.holders(symbol, "insider_transactions"),
+        }, None
+
+    @staticmethod
+    def insider_purchases(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.holders(symbol, "insider_purchases"),
+        }, None
+
+    @staticmethod
+    def insider_roster_holders(**kwargs):
+        symbol = kwargs.get("symbol")
+        return {
+            "symbol": symbol,
+            "data": _TickerData._statement_store.holders(symbol, "insider_roster_holders"),
+        }, None
+
     #
     # @staticmethod
     # def dividends(**kwargs):
@@ -315,102 +539,6 @@ class TickerInfo:
     #     }
     #
     # @staticmethod
-    # def income_stmt(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "income_stmt")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
-    # def quarterly_income_stmt(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "quarterly_income_stmt")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
-    # def balance_sheet(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "balance_sheet")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
-    # def quarterly_balance_sheet(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "quarterly_balance_sheet")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
-    # def cashflow(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "cashflow")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
-    # def quarterly_cashflow(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "quarterly_cashflow")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
-    # def major_holders(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "major_holders")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
-    # def institutional_holders(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "institutional_holders")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
-    # def mutualfund_holders(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "mutualfund_holders")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
-    # def insider_transactions(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "insider_transactions")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
-    # def insider_purchases(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "insider_purchases")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
-    # def insider_roster_holders(**kwargs):
-    #     data = _TickerData.get_data(kwargs.get("symbol"), "insider_roster_holders")
-    #     return {
-    #         "symbol": kwargs.get("symbol"),
-    #         "data": data.reset_index().to_json(orient="records", date_format="iso")
-    #     }
-    #
-    # @staticmethod
     # def recommendations(**kwargs):
     #     data = _TickerData.get_data(kwargs.get("symbol"), "recommendations")
     #     return {